@@ -4,115 +4,497 @@ import sqlite3
 import pandas as pd
 import datetime
 import os
-import plotly.express as px
-from fpdf import FPDF
-import xml.etree.ElementTree as ET
+import threading
+import queue
+from contextlib import contextmanager
+import io
+import csv
+
+try:  # optional, several times faster than the stdlib parser
+    import orjson as json_lib
+except ImportError:
+    import json as json_lib
 
 # ==========================================================
 #                DATABASE INITIALISATION
 # ==========================================================
 DB_PATH = "health_data.db"
-conn = sqlite3.connect(DB_PATH, check_same_thread=False)
-conn.row_factory = sqlite3.Row
-cur = conn.cursor()
 
 
-def init_db():
-    # Medications – now supports family members + dates + caregiver email
-    cur.execute(
-        """
-        CREATE TABLE IF NOT EXISTS medications (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            person TEXT DEFAULT 'Self',
-            name TEXT NOT NULL,
-            date TEXT NOT NULL,           -- YYYY-MM-DD
-            time TEXT NOT NULL,           -- HH:MM
-            taken INTEGER DEFAULT 0,
-            caregiver_email TEXT
-        )
-        """
+def _connect(readonly: bool = False) -> sqlite3.Connection:
+    """Open a tuned connection; read-only ones skip the writer PRAGMAs."""
+    mode = "ro" if readonly else "rwc"
+    # check_same_thread=False: connections outlive the session threads using them
+    # isolation_level=None: no implicit BEGINs – writes use transaction() below
+    c = sqlite3.connect(
+        f"file:{DB_PATH}?mode={mode}",
+        uri=True,
+        check_same_thread=False,
+        isolation_level=None,
+        cached_statements=256,
     )
+    c.row_factory = sqlite3.Row
+    if not readonly:
+        c.execute("PRAGMA journal_mode=WAL")  # stored in the file, readers inherit it
+        c.execute("PRAGMA synchronous=NORMAL")
+    c.execute("PRAGMA temp_store=MEMORY")
+    c.execute("PRAGMA cache_size=-20000")  # ~20 MB page cache
+    c.execute("PRAGMA mmap_size=268435456")  # 256 MB memory-mapped reads
+    return c
 
-    # Health metrics – also per person
-    cur.execute(
-        """
-        CREATE TABLE IF NOT EXISTS health_metrics (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            person TEXT DEFAULT 'Self',
-            date TEXT NOT NULL,           -- YYYY-MM-DD
-            steps INTEGER DEFAULT 0,
-            calories INTEGER DEFAULT 0
-        )
-        """
-    )
 
-    # Goals table – single row, global goals
-    cur.execute(
-        """
-        CREATE TABLE IF NOT EXISTS goals (
-            id INTEGER PRIMARY KEY CHECK (id=1),
-            weekly_steps_target INTEGER DEFAULT 35000,
-            daily_calories_target INTEGER DEFAULT 2200
+@st.cache_resource(show_spinner=False)  # runs before set_page_config
+def get_conn() -> sqlite3.Connection:
+    """The one write connection, shared across reruns and sessions."""
+    return _connect()
+
+
+@st.cache_resource(show_spinner=False)
+def get_write_lock() -> threading.Lock:
+    """Serialises transactions on the shared connection across sessions."""
+    return threading.Lock()
+
+
+@st.cache_resource(show_spinner=False)
+def _reader_pool() -> queue.SimpleQueue:
+    """Idle read-only connections, kept across reruns and sessions."""
+    return queue.SimpleQueue()
+
+
+@contextmanager
+def reading():
+    """Borrow a read-only connection from the pool for one query.
+
+    Reads never touch the write connection, so under WAL they only see
+    committed rows and don't wait on the write lock.
+    """
+    pool = _reader_pool()
+    try:
+        c = pool.get_nowait()
+    except queue.Empty:
+        c = _connect(readonly=True)
+    try:
+        yield c
+    finally:
+        pool.put(c)
+
+
+conn = get_conn()
+
+
+@contextmanager
+def transaction():
+    """Explicit BEGIN … COMMIT on the shared connection, ROLLBACK on error."""
+    with get_write_lock():
+        conn.execute("BEGIN")
+        try:
+            yield conn
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            invalidate_cache()  # anything cached since BEGIN may be stale
+            raise
+
+
+def init_db():
+    with transaction() as c:
+        # Medications – now supports family members + dates + caregiver email
+        c.execute(
+            """
+            CREATE TABLE IF NOT EXISTS medications (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                person TEXT DEFAULT 'Self',
+                name TEXT NOT NULL,
+                date TEXT NOT NULL,           -- YYYY-MM-DD
+                time TEXT NOT NULL,           -- HH:MM
+                taken INTEGER DEFAULT 0,
+                caregiver_email TEXT
+            )
+            """
         )
-        """
-    )
-    cur.execute("INSERT OR IGNORE INTO goals(id) VALUES (1)")
 
-    conn.commit()
+        # Health metrics – also per person
+        c.execute(
+            """
+            CREATE TABLE IF NOT EXISTS health_metrics (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                person TEXT DEFAULT 'Self',
+                date TEXT NOT NULL,           -- YYYY-MM-DD
+                steps INTEGER DEFAULT 0,
+                calories INTEGER DEFAULT 0
+            )
+            """
+        )
 
+        # Goals table – single row, global goals
+        c.execute(
+            """
+            CREATE TABLE IF NOT EXISTS goals (
+                id INTEGER PRIMARY KEY CHECK (id=1),
+                weekly_steps_target INTEGER DEFAULT 35000,
+                daily_calories_target INTEGER DEFAULT 2200
+            )
+            """
+        )
+        c.execute("INSERT OR IGNORE INTO goals(id) VALUES (1)")
 
-init_db()
+        # Indexes – every hot query filters by person and sorts by date/time
+        c.execute(
+            "CREATE INDEX IF NOT EXISTS idx_meds_person_date "
+            "ON medications(person, date, time)"
+        )
+        c.execute(
+            "CREATE INDEX IF NOT EXISTS idx_meds_person_taken "
+            "ON medications(person, taken)"
+        )
+        c.execute(
+            "CREATE INDEX IF NOT EXISTS idx_metrics_person_date "
+            "ON health_metrics(person, date)"
+        )
 
 
 # ==========================================================
 #          SMALL HELPERS (DB ACCESS & INSIGHTS)
 # ==========================================================
-def get_people():
-    """Return list of distinct persons from DB, ensure 'Self' exists."""
+def db_mtime() -> float:
+    """Last modification time of the DB – cache key for read helpers.
+
+    In WAL mode writes land in the -wal file until a checkpoint, so take
+    the newer of the two.
+    """
+    wal_path = DB_PATH + "-wal"
+    mtime = os.path.getmtime(DB_PATH)
+    if os.path.exists(wal_path):
+        mtime = max(mtime, os.path.getmtime(wal_path))
+    return mtime
+
+
+def query_df(sql: str, params: tuple = ()) -> pd.DataFrame:
+    """Run a query and build a DataFrame directly from the fetched tuples.
+
+    Cheaper than pd.read_sql for our small fixed schemas.
+    """
+    with reading() as rc:
+        c = rc.cursor()
+        c.row_factory = None  # plain tuples rather than sqlite3.Row
+        c.execute(sql, params)
+        columns = [d[0] for d in c.description]
+        rows = c.fetchall()
+    return pd.DataFrame.from_records(rows, columns=columns)
+
+
+def invalidate_cache():
+    """Drop all cached query results and charts after a write to the DB."""
+    st.cache_data.clear()
+    # not st.cache_resource.clear() – that would also drop the connection
+    for chart_fn in (
+        _metric_chart_cached,
+        _steps_calories_chart_cached,
+        _weekly_steps_chart_cached,
+        _adherence_chart_cached,
+    ):
+        chart_fn.clear()
+
+
+@st.cache_data(ttl=300)
+def _get_people_cached(mtime: float) -> list[str]:
     people = set(["Self"])
-    cur.execute("SELECT DISTINCT person FROM medications")
-    people.update([r[0] for r in cur.fetchall()])
-    cur.execute("SELECT DISTINCT person FROM health_metrics")
-    people.update([r[0] for r in cur.fetchall()])
+    with reading() as c:
+        people.update(r[0] for r in c.execute("SELECT DISTINCT person FROM medications"))
+        people.update(r[0] for r in c.execute("SELECT DISTINCT person FROM health_metrics"))
     return sorted(list(people))
 
 
-def get_goals():
-    row = cur.execute(
-        "SELECT weekly_steps_target, daily_calories_target FROM goals WHERE id=1"
-    ).fetchone()
+def get_people():
+    """Return list of distinct persons from DB, ensure 'Self' exists."""
+    return _get_people_cached(db_mtime())
+
+
+def canon_person(name: str) -> str:
+    """Canonical spelling of a person name.
+
+    Whitespace is collapsed and a case-insensitive match against existing
+    profiles reuses their stored spelling, so "john " and "John" map to the
+    same rows (and the same cache keys).
+    """
+    cleaned = " ".join(name.split())
+    for existing in get_people():
+        if existing.casefold() == cleaned.casefold():
+            return existing
+    return cleaned
+
+
+@st.cache_data(ttl=300)
+def _get_goals_cached(mtime: float) -> tuple[int, int]:
+    with reading() as c:
+        row = c.execute(
+            "SELECT weekly_steps_target, daily_calories_target FROM goals WHERE id=1"
+        ).fetchone()
     if row:
         return int(row[0]), int(row[1])
     return 35000, 2200
 
 
+def get_goals():
+    return _get_goals_cached(db_mtime())
+
+
+@st.cache_data(ttl=300)
+def _medication_adherence_cached(
+    person: str | None, mtime: float
+) -> tuple[int, int, float]:
+    with reading() as c:
+        if person:
+            row = c.execute(
+                "SELECT COALESCE(SUM(taken), 0), COUNT(*) FROM medications WHERE person=?",
+                (person,),
+            ).fetchone()
+        else:
+            row = c.execute(
+                "SELECT COALESCE(SUM(taken), 0), COUNT(*) FROM medications"
+            ).fetchone()
+
+    taken, total = int(row[0]), int(row[1])
+    pct = (taken / total) * 100 if total > 0 else 0.0
+    return taken, total, pct
+
+
 def medication_adherence(person: str | None = None) -> tuple[int, int, float]:
     """Return (taken_count, total_count, adherence_percent)."""
+    return _medication_adherence_cached(person, db_mtime())
+
+
+@st.cache_data(ttl=300)
+def _adherence_by_person_cached(mtime: float):
+    return query_df(
+        """
+        SELECT person, SUM(taken) AS taken, COUNT(*) AS total,
+               100.0 * SUM(taken) / COUNT(*) AS adherence
+        FROM medications GROUP BY person
+        """
+    )
+
+
+def adherence_by_person():
+    """Per-person taken/total/adherence % for the dashboard bar chart."""
+    return _adherence_by_person_cached(db_mtime())
+
+
+@st.cache_data(ttl=300)
+def _load_metrics_cached(person: str | None, mtime: float):
     if person:
-        df = pd.read_sql(
-            "SELECT taken FROM medications WHERE person=?",
-            conn,
-            params=(person,),
+        df = query_df(
+            "SELECT * FROM health_metrics WHERE person=? ORDER BY date", (person,)
         )
     else:
-        df = pd.read_sql("SELECT taken FROM medications", conn)
+        df = query_df("SELECT * FROM health_metrics ORDER BY date")
+    df["date"] = pd.to_datetime(df["date"])
+    return df
 
-    if df.empty:
-        return 0, 0, 0.0
-    total = len(df)
-    taken = int(df["taken"].sum())
+
+def load_metrics(person: str | None = None):
+    return _load_metrics_cached(person, db_mtime())
+
+
+@st.cache_data(ttl=300)
+def _load_medications_cached(person: str, mtime: float):
+    return query_df(
+        "SELECT * FROM medications WHERE person=? ORDER BY date, time", (person,)
+    )
+
+
+def load_medications(person: str):
+    """Medication schedule for a person, ordered by date and time."""
+    return _load_medications_cached(person, db_mtime())
+
+
+def person_metrics(person: str):
+    """load_metrics() memoised in session_state for the current DB version.
+
+    The dashboard, metrics and insights tabs all need the same frame; this
+    skips re-fetching (and re-copying) it from the cache on every call.
+    The frame is shared, so callers must treat it as read-only.
+    """
+    key = (person, db_mtime())
+    if st.session_state.get("_metrics_key") != key:
+        st.session_state["_metrics_df"] = load_metrics(person)
+        st.session_state["_metrics_key"] = key
+    return st.session_state["_metrics_df"]
+
+
+@st.cache_data(ttl=300)
+def _avg_last_n_days_cached(person: str, n: int, mtime: float):
+    with reading() as c:
+        row = c.execute(
+            """
+            SELECT
+                AVG(CASE WHEN date >= date('now', 'localtime', ?) THEN steps END),
+                AVG(CASE WHEN date >= date('now', 'localtime', ?) THEN calories END),
+                COUNT(*)
+            FROM health_metrics WHERE person=?
+            """,
+            (f"-{n - 1} days", f"-{n - 1} days", person),
+        ).fetchone()
+    if not row[2]:
+        return None
+    return int(row[0] or 0), int(row[1] or 0)
+
+
+def avg_last_n_days(person: str, n: int = 7) -> tuple[int, int] | None:
+    """Return (avg_steps, avg_calories) over the last n days (incl. today).
+
+    None when the person has no metrics at all.
+    """
+    return _avg_last_n_days_cached(person, n, db_mtime())
+
+
+@st.cache_data(ttl=300)
+def _dashboard_summary_cached(person: str, mtime: float):
+    with reading() as c:
+        row = c.execute(
+            """
+            SELECT
+                (SELECT COALESCE(SUM(taken), 0) FROM medications WHERE person=?),
+                (SELECT COUNT(*) FROM medications WHERE person=?),
+                (SELECT COALESCE(AVG(steps), 0) FROM health_metrics
+                    WHERE person=? AND date >= date('now', 'localtime', '-6 days')),
+                (SELECT COALESCE(AVG(calories), 0) FROM health_metrics
+                    WHERE person=? AND date >= date('now', 'localtime', '-6 days'))
+            """,
+            (person,) * 4,
+        ).fetchone()
+    taken, total = int(row[0]), int(row[1])
     pct = (taken / total) * 100 if total > 0 else 0.0
-    return taken, total, pct
+    return taken, total, pct, int(row[2]), int(row[3])
 
 
-def load_metrics(person: str | None = None):
-    if person:
-        return pd.read_sql(
-            "SELECT * FROM health_metrics WHERE person=? ORDER BY date",
-            conn,
-            params=(person,),
+def dashboard_summary(person: str) -> tuple[int, int, float, int, int]:
+    """Return (taken, total, adherence_pct, avg_steps_7d, avg_calories_7d)."""
+    return _dashboard_summary_cached(person, db_mtime())
+
+
+@st.cache_data(ttl=300)
+def _steps_this_week_cached(person: str, mtime: float) -> int:
+    # Monday .. Sunday of the current (local) week
+    with reading() as c:
+        row = c.execute(
+            """
+            SELECT COALESCE(SUM(steps), 0) FROM health_metrics
+            WHERE person=?
+              AND date BETWEEN date('now', 'localtime', 'weekday 0', '-6 days')
+                           AND date('now', 'localtime', 'weekday 0')
+            """,
+            (person,),
+        ).fetchone()
+    return int(row[0])
+
+
+def steps_this_week(person: str) -> int:
+    return _steps_this_week_cached(person, db_mtime())
+
+
+@st.cache_data(ttl=300)
+def _weekly_steps_cached(person: str, mtime: float):
+    # week = Monday the week starts on, so weeks never collide across years
+    return query_df(
+        """
+        SELECT date(date, 'weekday 0', '-6 days') AS week, SUM(steps) AS steps
+        FROM health_metrics WHERE person=?
+        GROUP BY week ORDER BY week
+        """,
+        (person,),
+    )
+
+
+def weekly_steps(person: str):
+    """Total steps per week (week, steps) for the Goals tab."""
+    return _weekly_steps_cached(person, db_mtime())
+
+
+@st.cache_data(ttl=300)
+def _export_csv_cached(table: str, mtime: float) -> bytes:
+    # Write straight from the cursor – no DataFrame in between
+    buf = io.StringIO()
+    writer = csv.writer(buf, lineterminator="\n")
+    with reading() as rc:
+        c = rc.cursor()
+        c.row_factory = None
+        c.execute(f"SELECT * FROM {table}")
+        writer.writerow([d[0] for d in c.description])
+        while rows := c.fetchmany(1000):
+            writer.writerows(rows)
+    return buf.getvalue().encode()
+
+
+def export_csv(table: str) -> bytes:
+    """Full table as CSV bytes, re-serialised only after the DB changes."""
+    if table not in ("medications", "health_metrics"):
+        raise ValueError(f"Unknown table: {table}")
+    return _export_csv_cached(table, db_mtime())
+
+
+def read_upload_csv(f):
+    """Parse an uploaded metrics CSV, using the multithreaded pyarrow engine if present."""
+    try:
+        return pd.read_csv(f, engine="pyarrow", parse_dates=["date"])
+    except ImportError:
+        f.seek(0)
+        # cache_dates: repeated date strings are parsed once
+        return pd.read_csv(f, parse_dates=["date"], cache_dates=True)
+
+
+def parse_upload_dates(col: pd.Series) -> pd.Series:
+    """Parse a JSON upload's date column as naive datetimes.
+
+    Epoch numbers get pd.read_json's unit probing: the first of s, ms,
+    us, ns that yields an in-range timestamp wins. Strings may mix plain
+    dates with offset or "Z" timestamps; those are converted to UTC.
+
+    >>> parse_upload_dates(pd.Series([1704412800])).dt.strftime("%Y-%m-%d").tolist()
+    ['2024-01-05']
+    >>> parse_upload_dates(
+    ...     pd.Series(["2024-01-05", "2024-01-06T10:00:00Z"])
+    ... ).dt.strftime("%Y-%m-%d").tolist()
+    ['2024-01-05', '2024-01-06']
+    """
+    if pd.api.types.is_numeric_dtype(col):
+        for unit in ("s", "ms", "us"):
+            try:
+                return pd.to_datetime(col, unit=unit)
+            except (ValueError, OverflowError):  # OutOfBoundsDatetime is a ValueError
+                continue
+        return pd.to_datetime(col, unit="ns")
+    parsed = pd.to_datetime(col, format="mixed", utc=True, cache=True)
+    return parsed.dt.tz_localize(None)
+
+
+def iter_metric_rows(df, chunksize: int = 10_000):
+    """Yield (date, steps, calories) tuples from an upload frame chunk by chunk.
+
+    Columns are converted with .tolist() per chunk (plain Python values –
+    sqlite3 can't bind numpy.int64), so only one chunk of tuples is alive
+    at a time instead of a second full copy of the upload.
+    """
+    for start in range(0, len(df), chunksize):
+        chunk = df.iloc[start : start + chunksize]
+        yield from zip(
+            chunk["date"].dt.strftime("%Y-%m-%d").tolist(),
+            chunk["steps"].astype(int).tolist(),
+            chunk["calories"].astype(int).tolist(),
         )
-    return pd.read_sql("SELECT * FROM health_metrics ORDER BY date", conn)
+
+
+def insert_metrics_rows(person: str, rows):
+    """Bulk-insert (date, steps, calories) tuples for a person.
+
+    One executemany inside one transaction; used by all upload importers.
+    """
+    with transaction():
+        conn.executemany(
+            "INSERT INTO health_metrics (person, date, steps, calories) VALUES (?,?,?,?)",
+            ((person, d, s, c) for d, s, c in rows),
+        )
+    invalidate_cache()
 
 
 def generate_recommendations(person: str) -> list[str]:
@@ -123,12 +505,9 @@ def generate_recommendations(person: str) -> list[str]:
     weekly_goal, daily_cal_goal = get_goals()
 
     # Steps & calories (recent 7 days)
-    df = load_metrics(person)
-    if not df.empty:
-        df["date"] = pd.to_datetime(df["date"])
-        last7 = df[df["date"] >= (pd.Timestamp.today().normalize() - pd.Timedelta(days=6))]
-        avg_steps = int(last7["steps"].mean()) if not last7.empty else 0
-        avg_cals = int(last7["calories"].mean()) if not last7.empty else 0
+    averages = avg_last_n_days(person, 7)
+    if averages is not None:
+        avg_steps, avg_cals = averages
 
         if avg_steps < (weekly_goal / 7) * 0.8:
             recs.append(
@@ -171,51 +550,169 @@ def generate_recommendations(person: str) -> list[str]:
     return recs
 
 
-def make_pdf_report(person: str) -> bytes:
-    df = load_metrics(person)
+def _pdf_header(pdf, person: str, generated_on: str):
+    """Title + goals/adherence block."""
     weekly_goal, daily_cal_goal = get_goals()
     taken, total, pct = medication_adherence(person)
 
-    pdf = FPDF()
-    pdf.add_page()
-    pdf.set_font("Arial", size=16)
-    pdf.cell(0, 10, f"Healthcare Report – {person}", ln=True)
+    pdf.set_font("Helvetica", size=16)
+    pdf.cell(0, 10, f"Healthcare Report - {person}", new_x="LMARGIN", new_y="NEXT")
 
-    pdf.set_font("Arial", size=11)
+    pdf.set_font("Helvetica", size=11)
     pdf.multi_cell(
         0,
         6,
-        f"Generated on: {datetime.date.today().isoformat()}\n"
+        f"Generated on: {generated_on}\n"
         f"Weekly Steps Goal: {weekly_goal}\n"
         f"Daily Calories Goal: {daily_cal_goal}\n"
         f"Medication adherence: {pct:.1f}% ({taken}/{total})",
     )
     pdf.ln(4)
 
-    pdf.set_font("Arial", size=12)
-    pdf.cell(0, 10, "Recent Health Metrics", ln=True)
-    pdf.set_font("Arial", size=10)
+
+def _pdf_body(pdf, df, recs: list[str]):
+    """Recent metrics table + insight bullets."""
+    pdf.set_font("Helvetica", size=12)
+    pdf.cell(0, 10, "Recent Health Metrics", new_x="LMARGIN", new_y="NEXT")
+    pdf.set_font("Helvetica", size=10)
     if not df.empty:
-        for _, r in df.tail(20).iterrows():
-            pdf.cell(
-                0,
-                6,
-                f"{r['date']} | steps={int(r['steps'])} | calories={int(r['calories'])}",
-                ln=True,
+        recent = df.tail(20)
+        lines = [
+            f"{d} | steps={steps} | calories={cals}"
+            for d, steps, cals in zip(
+                recent["date"].dt.strftime("%Y-%m-%d").tolist(),
+                recent["steps"].astype(int).tolist(),
+                recent["calories"].astype(int).tolist(),
             )
+        ]
+        # one text block instead of a cell() call per row
+        pdf.multi_cell(0, 6, "\n".join(lines), new_x="LMARGIN", new_y="NEXT")
     else:
-        pdf.cell(0, 6, "No metrics recorded yet.", ln=True)
+        pdf.cell(0, 6, "No metrics recorded yet.", new_x="LMARGIN", new_y="NEXT")
 
-    recs = generate_recommendations(person)
     pdf.ln(4)
-    pdf.set_font("Arial", size=12)
-    pdf.cell(0, 10, "Health Insights", ln=True)
-    pdf.set_font("Arial", size=10)
+    pdf.set_font("Helvetica", size=12)
+    pdf.cell(0, 10, "Health Insights", new_x="LMARGIN", new_y="NEXT")
+    pdf.set_font("Helvetica", size=10)
     for r in recs:
         pdf.multi_cell(0, 5, f"- {r}")
         pdf.ln(1)
 
-    return pdf.output(dest="S").encode("latin-1")
+
+@st.cache_data(ttl=300)
+def _pdf_report_cached(person: str, generated_on: str, mtime: float) -> bytes:
+    from fpdf import FPDF  # deferred – only needed when a report is requested
+
+    pdf = FPDF()
+    pdf.add_page()
+    _pdf_header(pdf, person, generated_on)
+    _pdf_body(pdf, load_metrics(person), generate_recommendations(person))
+    # fpdf2 returns a bytearray directly
+    return bytes(pdf.output())
+
+
+def make_pdf_report(person: str) -> bytes:
+    """Rendered report bytes – rebuilt only when the data or the day changes."""
+    return _pdf_report_cached(person, datetime.date.today().isoformat(), db_mtime())
+
+
+# ==========================================================
+#          CACHED CHARTS (rebuilt only when data changes)
+# ==========================================================
+# cache_resource hands back the same Figure object instead of unpickling a
+# copy on every rerun; st.plotly_chart only reads it. plotly.express is
+# imported inside each builder so it is only loaded once a chart is drawn.
+@st.cache_resource(ttl=300, max_entries=64)
+def _metric_chart_cached(person: str, column: str, title: str, mtime: float):
+    import plotly.express as px
+
+    # Only the two plotted columns, straight from the cursor – no DataFrame
+    with reading() as rc:
+        c = rc.cursor()
+        c.row_factory = None
+        rows = c.execute(
+            f"SELECT date, {column} FROM health_metrics WHERE person=? ORDER BY date",
+            (person,),
+        ).fetchall()
+    dates = [r[0] for r in rows]
+    values = [r[1] for r in rows]
+    return px.line(
+        x=dates, y=values, title=title, labels={"x": "date", "y": column}
+    )
+
+
+def metric_chart(person: str, column: str, title: str):
+    """Line chart of one health_metrics column over time for a person."""
+    if column not in ("steps", "calories"):
+        raise ValueError(f"Unknown metric: {column}")
+    return _metric_chart_cached(person, column, title, db_mtime())
+
+
+@st.cache_resource(ttl=300, max_entries=64)
+def _steps_calories_chart_cached(person: str, mtime: float):
+    import plotly.graph_objects as go
+
+    with reading() as rc:
+        c = rc.cursor()
+        c.row_factory = None
+        rows = c.execute(
+            "SELECT date, steps, calories FROM health_metrics WHERE person=? ORDER BY date",
+            (person,),
+        ).fetchall()
+    dates = [r[0] for r in rows]
+    fig = go.Figure()
+    fig.add_scatter(x=dates, y=[r[1] for r in rows], name="Steps")
+    fig.add_scatter(x=dates, y=[r[2] for r in rows], name="Calories", yaxis="y2")
+    fig.update_layout(
+        title="Steps & calories trend",
+        xaxis_title="date",
+        yaxis=dict(title="steps"),
+        yaxis2=dict(title="calories", overlaying="y", side="right"),
+    )
+    return fig
+
+
+def steps_calories_chart(person: str):
+    """Steps and calories in one figure, calories on a secondary y-axis."""
+    return _steps_calories_chart_cached(person, db_mtime())
+
+
+@st.cache_resource(ttl=300, max_entries=64)
+def _weekly_steps_chart_cached(person: str, mtime: float):
+    import plotly.express as px
+
+    return px.bar(
+        weekly_steps(person),
+        x="week",
+        y="steps",
+        title=f"Weekly steps for {person}",
+    )
+
+
+def weekly_steps_chart(person: str):
+    return _weekly_steps_chart_cached(person, db_mtime())
+
+
+@st.cache_resource(ttl=300, max_entries=64)
+def _adherence_chart_cached(mtime: float):
+    import plotly.express as px
+
+    return px.bar(
+        adherence_by_person(),
+        x="person",
+        y="adherence",
+        title="Adherence by family member",
+        labels={"adherence": "Adherence %"},
+        range_y=[0, 100],
+    )
+
+
+def adherence_chart():
+    return _adherence_chart_cached(db_mtime())
+
+
+# after the helpers: a failed transaction() calls invalidate_cache()
+init_db()
 
 
 # ==========================================================
@@ -238,13 +735,15 @@ active_person = st.sidebar.selectbox("Active person", people, index=people.index
 
 new_person = st.sidebar.text_input("Add family member name")
 if st.sidebar.button("Add person") and new_person.strip():
+    person_use = canon_person(new_person)
     # we simply insert via a dummy row in metrics so that person appears
-    cur.execute(
-        "INSERT INTO health_metrics(person, date, steps, calories) VALUES (?,?,?,?)",
-        (new_person.strip(), datetime.date.today().isoformat(), 0, 0),
-    )
-    conn.commit()
-    st.sidebar.success(f"Added profile for {new_person.strip()}. Refresh list from sidebar.")
+    with transaction():
+        conn.execute(
+            "INSERT INTO health_metrics(person, date, steps, calories) VALUES (?,?,?,?)",
+            (person_use, datetime.date.today().isoformat(), 0, 0),
+        )
+    invalidate_cache()
+    st.sidebar.success(f"Added profile for {person_use}. Refresh list from sidebar.")
 
 st.sidebar.markdown("---")
 st.sidebar.write(f"Currently managing data for: **{active_person}**")
@@ -268,8 +767,8 @@ with tabs[0]:
     st.header(f"Overall Dashboard – {active_person}")
 
     col_a, col_b, col_c = st.columns(3)
-    taken, total, pct = medication_adherence(active_person)
-    df_person = load_metrics(active_person)
+    taken, total, pct, avg_steps, avg_cal = dashboard_summary(active_person)
+    df_person = person_metrics(active_person)
 
     with col_a:
         st.subheader("Medication Adherence")
@@ -282,15 +781,6 @@ with tabs[0]:
 
     with col_b:
         st.subheader("Steps (last 7 days)")
-        if not df_person.empty:
-            df_person["date"] = pd.to_datetime(df_person["date"])
-            last7 = df_person[
-                df_person["date"]
-                >= (pd.Timestamp.today().normalize() - pd.Timedelta(days=6))
-            ]
-            avg_steps = int(last7["steps"].mean()) if not last7.empty else 0
-        else:
-            avg_steps = 0
         weekly_goal, daily_cal_goal = get_goals()
         st.metric("Avg daily steps (7d)", f"{avg_steps:,}")
         if weekly_goal > 0:
@@ -300,14 +790,6 @@ with tabs[0]:
 
     with col_c:
         st.subheader("Calories (last 7 days)")
-        if not df_person.empty:
-            last7 = df_person[
-                df_person["date"]
-                >= (pd.Timestamp.today().normalize() - pd.Timedelta(days=6))
-            ]
-            avg_cal = int(last7["calories"].mean()) if not last7.empty else 0
-        else:
-            avg_cal = 0
         st.metric("Avg daily calories (7d)", f"{avg_cal:,}")
         if daily_cal_goal > 0:
             st.progress(min(1.0, avg_cal / daily_cal_goal))
@@ -322,7 +804,7 @@ with tabs[0]:
         if not df_person.empty:
             st.dataframe(df_person.tail(10), use_container_width=True)
             st.plotly_chart(
-                px.line(df_person, x="date", y="steps", title="Steps trend"),
+                metric_chart(active_person, "steps", "Steps trend"),
                 use_container_width=True,
             )
         else:
@@ -330,31 +812,12 @@ with tabs[0]:
 
     with col2:
         st.subheader("Medication Overview")
-        meds_df = pd.read_sql(
-            "SELECT * FROM medications WHERE person=? ORDER BY date, time",
-            conn,
-            params=(active_person,),
-        )
+        meds_df = load_medications(active_person)
         if meds_df.empty:
             st.info("No medications recorded yet.")
         else:
             st.dataframe(meds_df, use_container_width=True)
-            by_person = pd.read_sql(
-                "SELECT person, SUM(taken) as taken, COUNT(*) as total FROM medications GROUP BY person",
-                conn,
-            )
-            by_person["adherence"] = (by_person["taken"] / by_person["total"]) * 100
-            st.plotly_chart(
-                px.bar(
-                    by_person,
-                    x="person",
-                    y="adherence",
-                    title="Adherence by family member",
-                    labels={"adherence": "Adherence %"},
-                    range_y=[0, 100],
-                ),
-                use_container_width=True,
-            )
+            st.plotly_chart(adherence_chart(), use_container_width=True)
 
 # ==========================================================
 # TAB 1 – MEDICATION MANAGER (Week 5–6 enhancements)
@@ -374,31 +837,28 @@ with tabs[1]:
         )
 
     if st.button("Add Medication"):
-        person_use = med_person.strip() or active_person
+        person_use = canon_person(med_person) or active_person
         if name and time_str:
-            cur.execute(
-                "INSERT INTO medications (person, name, date, time, taken, caregiver_email) "
-                "VALUES (?,?,?,?,?,?)",
-                (
-                    person_use,
-                    name.strip(),
-                    med_date.isoformat(),
-                    time_str.strip(),
-                    0,
-                    caregiver_email.strip() or None,
-                ),
-            )
-            conn.commit()
+            with transaction():
+                conn.execute(
+                    "INSERT INTO medications (person, name, date, time, taken, caregiver_email) "
+                    "VALUES (?,?,?,?,?,?)",
+                    (
+                        person_use,
+                        name.strip(),
+                        med_date.isoformat(),
+                        time_str.strip(),
+                        0,
+                        caregiver_email.strip() or None,
+                    ),
+                )
+            invalidate_cache()
             st.success(f"✅ Added {name} for {person_use} at {time_str} on {med_date}.")
         else:
             st.error("Please fill in at least medicine name and time.")
 
     st.markdown("### Current Schedule")
-    meds_df = pd.read_sql(
-        "SELECT * FROM medications WHERE person=? ORDER BY date, time",
-        conn,
-        params=(active_person,),
-    )
+    meds_df = load_medications(active_person)
     if meds_df.empty:
         st.info(f"No medications saved yet for {active_person}.")
     else:
@@ -409,17 +869,19 @@ with tabs[1]:
         "Enter Medication ID to mark as taken", min_value=1, step=1, value=1
     )
     if st.button("Mark as Taken"):
-        cur.execute(
-            "UPDATE medications SET taken=1 WHERE id=?", (int(med_id),)
-        )
-        conn.commit()
+        with transaction():
+            conn.execute(
+                "UPDATE medications SET taken=1 WHERE id=?", (int(med_id),)
+            )
+        invalidate_cache()
         st.success(f"Marked medication ID {int(med_id)} as taken.")
 
     if st.button("Reset All 'Taken' Flags for Active Person"):
-        cur.execute(
-            "UPDATE medications SET taken=0 WHERE person=?", (active_person,)
-        )
-        conn.commit()
+        with transaction():
+            conn.execute(
+                "UPDATE medications SET taken=0 WHERE person=?", (active_person,)
+            )
+        invalidate_cache()
         st.info(f"Reset all medications to not taken for {active_person}.")
 
 # ==========================================================
@@ -441,26 +903,27 @@ with tabs[2]:
     )
 
     if st.button("Save Metrics"):
-        person_use = person_for_metrics.strip() or active_person
-        cur.execute(
-            "INSERT INTO health_metrics (person, date, steps, calories) VALUES (?,?,?,?)",
-            (person_use, date.isoformat(), int(steps), int(calories)),
-        )
-        conn.commit()
+        person_use = canon_person(person_for_metrics) or active_person
+        with transaction():
+            conn.execute(
+                "INSERT INTO health_metrics (person, date, steps, calories) VALUES (?,?,?,?)",
+                (person_use, date.isoformat(), int(steps), int(calories)),
+            )
+        invalidate_cache()
         st.success(f"Saved metrics for {person_use} on {date}.")
 
     if st.button("View Metrics for Active Person"):
-        dfm = load_metrics(active_person)
+        dfm = person_metrics(active_person)
         if dfm.empty:
             st.warning("No metrics yet.")
         else:
             st.dataframe(dfm, use_container_width=True)
             st.plotly_chart(
-                px.line(dfm, x="date", y="steps", title="Steps over time"),
+                metric_chart(active_person, "steps", "Steps over time"),
                 use_container_width=True,
             )
             st.plotly_chart(
-                px.line(dfm, x="date", y="calories", title="Calories over time"),
+                metric_chart(active_person, "calories", "Calories over time"),
                 use_container_width=True,
             )
 
@@ -474,7 +937,9 @@ with tabs[3]:
     uploaded = st.file_uploader("CSV file", type=["csv"])
     if uploaded:
         try:
-            dfu = pd.read_csv(uploaded, parse_dates=["date"])
+            import plotly.express as px
+
+            dfu = read_upload_csv(uploaded)
             st.write("Preview of Uploaded CSV:")
             st.dataframe(dfu.head(), use_container_width=True)
 
@@ -488,18 +953,7 @@ with tabs[3]:
             )
 
             if st.button("Import CSV to DB"):
-                for _, r in dfu.iterrows():
-                    cur.execute(
-                        "INSERT INTO health_metrics (person, date, steps, calories) "
-                        "VALUES (?,?,?,?)",
-                        (
-                            active_person,
-                            r["date"].date().isoformat(),
-                            int(r["steps"]),
-                            int(r["calories"]),
-                        ),
-                    )
-                conn.commit()
+                insert_metrics_rows(active_person, iter_metric_rows(dfu))
                 st.success("CSV data imported successfully!")
         except Exception as e:
             st.error(f"CSV upload failed: {e}")
@@ -510,23 +964,14 @@ with tabs[3]:
     json_file = st.file_uploader("Upload JSON", type=["json"])
     if json_file:
         try:
-            jf = pd.read_json(json_file)
+            jf = pd.DataFrame(json_lib.loads(json_file.read()))
             if not {"date", "steps", "calories"}.issubset(jf.columns):
                 st.error("JSON must contain date, steps, calories.")
             else:
+                jf["date"] = parse_upload_dates(jf["date"])
                 st.dataframe(jf.head(), use_container_width=True)
                 if st.button("Import JSON to DB"):
-                    for _, r in jf.iterrows():
-                        cur.execute(
-                            "INSERT INTO health_metrics (person, date, steps, calories) VALUES (?,?,?,?)",
-                            (
-                                active_person,
-                                str(r["date"])[:10],
-                                int(r["steps"]),
-                                int(r["calories"]),
-                            ),
-                        )
-                    conn.commit()
+                    insert_metrics_rows(active_person, iter_metric_rows(jf))
                     st.success("JSON imported ✅")
         except Exception as e:
             st.error(f"JSON error: {e}")
@@ -534,36 +979,38 @@ with tabs[3]:
     xml_file = st.file_uploader("Upload XML", type=["xml"])
     if xml_file:
         try:
-            tree = ET.parse(xml_file)
-            root = tree.getroot()
+            import xml.etree.ElementTree as ET
+
+            # Stream <row> elements instead of building the whole DOM
             rows = []
-            for row in root.findall(".//row"):
-                rows.append(
-                    {
-                        "date": row.findtext("date"),
-                        "steps": int(row.findtext("steps")),
-                        "calories": int(row.findtext("calories")),
-                    }
-                )
-            xf = pd.DataFrame(rows)
-            if xf.empty:
+            open_elems = []  # ancestors of the current element
+            for event, elem in ET.iterparse(xml_file, events=("start", "end")):
+                if event == "start":
+                    open_elems.append(elem)
+                    continue
+                open_elems.pop()
+                if elem.tag == "row":
+                    rows.append(
+                        (
+                            elem.findtext("date"),
+                            int(elem.findtext("steps")),
+                            int(elem.findtext("calories")),
+                        )
+                    )
+                    # detach the processed row so the tree never grows
+                    if open_elems:
+                        open_elems[-1].remove(elem)
+            if not rows:
                 st.error(
                     "XML must have <row><date>..</date><steps>..</steps><calories>..</calories></row>"
                 )
             else:
-                st.dataframe(xf.head(), use_container_width=True)
+                st.dataframe(
+                    pd.DataFrame(rows[:5], columns=["date", "steps", "calories"]),
+                    use_container_width=True,
+                )
                 if st.button("Import XML to DB"):
-                    for _, r in xf.iterrows():
-                        cur.execute(
-                            "INSERT INTO health_metrics (person, date, steps, calories) VALUES (?,?,?,?)",
-                            (
-                                active_person,
-                                r["date"],
-                                int(r["steps"]),
-                                int(r["calories"]),
-                            ),
-                        )
-                    conn.commit()
+                    insert_metrics_rows(active_person, rows)
                     st.success("XML imported ✅")
         except Exception as e:
             st.error(f"XML error: {e}")
@@ -572,19 +1019,17 @@ with tabs[3]:
     col1, col2 = st.columns(2)
     with col1:
         if st.button("Export Medications CSV"):
-            meds = pd.read_sql("SELECT * FROM medications", conn)
             st.download_button(
                 "Download Medications",
-                meds.to_csv(index=False),
+                export_csv("medications"),
                 "medications.csv",
                 "text/csv",
             )
     with col2:
         if st.button("Export Health Metrics CSV"):
-            metrics = pd.read_sql("SELECT * FROM health_metrics", conn)
             st.download_button(
                 "Download Metrics",
-                metrics.to_csv(index=False),
+                export_csv("health_metrics"),
                 "metrics.csv",
                 "text/csv",
             )
@@ -603,35 +1048,25 @@ with tabs[4]:
         "Daily calories target", min_value=0, value=int(daily_cal_target), step=50
     )
     if st.button("Save Goals"):
-        cur.execute(
-            "UPDATE goals SET weekly_steps_target=?, daily_calories_target=? WHERE id=1",
-            (int(w_target), int(d_target)),
-        )
-        conn.commit()
+        with transaction():
+            conn.execute(
+                "UPDATE goals SET weekly_steps_target=?, daily_calories_target=? WHERE id=1",
+                (int(w_target), int(d_target)),
+            )
+        invalidate_cache()
         st.success("Goals updated ✅")
 
     st.markdown("### Goal Progress (for active person)")
-    dfm = load_metrics(active_person)
-    if dfm.empty:
+    weekly = weekly_steps(active_person)
+    if weekly.empty:
         st.info("Add some health metrics to see progress.")
     else:
-        dfm["date"] = pd.to_datetime(dfm["date"])
-        dfm["week"] = dfm["date"].dt.isocalendar().week
-        this_week = dfm[dfm["week"] == dfm["week"].max()]
-        wk_steps = int(this_week["steps"].sum()) if not this_week.empty else 0
+        wk_steps = steps_this_week(active_person)
 
         st.write(f"Steps this week for {active_person}: **{wk_steps} / {w_target}**")
         st.progress(min(1.0, wk_steps / max(1, w_target)))
 
-        st.plotly_chart(
-            px.bar(
-                dfm.groupby("week")["steps"].sum().reset_index(),
-                x="week",
-                y="steps",
-                title=f"Weekly steps for {active_person}",
-            ),
-            use_container_width=True,
-        )
+        st.plotly_chart(weekly_steps_chart(active_person), use_container_width=True)
 
 # ==========================================================
 # TAB 5 – INSIGHTS & PDF REPORT
@@ -639,19 +1074,11 @@ with tabs[4]:
 with tabs[5]:
     st.header(f"🧠 Insights & 📄 Report – {active_person}")
 
-    df = load_metrics(active_person)
+    df = person_metrics(active_person)
     if df.empty:
         st.info("Add some metrics to see insights.")
     else:
-        df["date"] = pd.to_datetime(df["date"])
-        st.plotly_chart(
-            px.line(df, x="date", y="steps", title="Steps trend"),
-            use_container_width=True,
-        )
-        st.plotly_chart(
-            px.line(df, x="date", y="calories", title="Calories trend"),
-            use_container_width=True,
-        )
+        st.plotly_chart(steps_calories_chart(active_person), use_container_width=True)
 
         st.subheader("Text Insights")
         recs = generate_recommendations(active_person)